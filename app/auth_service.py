@@ -1,29 +1,31 @@
 import os
-import mysql.connector
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
 import secrets
+import threading
+from urllib.parse import quote, urlencode
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Depends, Body
-from jose import jwt, JWTError
+from fastapi import APIRouter, HTTPException, Depends, Body, Request
+from fastapi.concurrency import run_in_threadpool
+import jwt
+from jwt import PyJWKClientConnectionError, PyJWTError
 from passlib.context import CryptContext
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from pydantic import BaseModel, EmailStr
 import httpx
+from limits import parse, storage, strategies
+from app.db import db_cursor
 # Load environment variables from secrets.env first, then .env
 load_dotenv("secrets.env")
 load_dotenv()
 
-# DB connection (duplicate of comm.py to avoid circular import)
-def get_conn():
-    return mysql.connector.connect(
-        host=os.getenv('DB_SERVER'),
-        port=int(os.getenv('DB_PORT', 3306)),
-        database=os.getenv('DB_DATABASE'),
-        user=os.getenv('DB_USERNAME'),
-        password=os.getenv('DB_PASSWORD'),
-    )
-
-# Password hashing (only bcrypt_sha256 to avoid 72-byte limit errors)
+# Password hashing: argon2id via argon2-cffi for new hashes
+PH = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+# Legacy bcrypt_sha256 hashes are still verified, then rehashed with argon2id on login
 pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
 
 # JWT
@@ -31,8 +33,66 @@ JWT_SECRET = os.getenv("AUTH_JWT_SECRET", "change-me")
 JWT_EXPIRES_MINUTES = int(os.getenv("AUTH_JWT_EXPIRES_MINUTES", "60"))
 JWT_ALG = "HS256"
 
+# OAuth client settings are fixed for the process lifetime, so the start URLs are built once
+GOOGLE_CLIENT_ID = os.getenv("OAUTH_GOOGLE_CLIENT_ID", "")
+GOOGLE_CLIENT_SECRET = os.getenv("OAUTH_GOOGLE_CLIENT_SECRET", "")
+GOOGLE_REDIRECT_URI = os.getenv("OAUTH_GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/oauth/google/callback")
+GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode(
+    {
+        "client_id": GOOGLE_CLIENT_ID,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "response_type": "code",
+        "scope": "openid email profile",
+        "access_type": "offline",
+    },
+    quote_via=quote,
+)
+
+FACEBOOK_CLIENT_ID = os.getenv("OAUTH_FACEBOOK_CLIENT_ID", "")
+FACEBOOK_REDIRECT_URI = os.getenv("OAUTH_FACEBOOK_REDIRECT_URI", "http://localhost:8000/auth/oauth/facebook/callback")
+FACEBOOK_AUTH_URL = "https://www.facebook.com/v11.0/dialog/oauth?" + urlencode(
+    {
+        "client_id": FACEBOOK_CLIENT_ID,
+        "redirect_uri": FACEBOOK_REDIRECT_URI,
+        "response_type": "code",
+        "scope": "email,public_profile",
+    },
+    quote_via=quote,
+)
+
+# Google signing keys, cached in-process so id_token verification is a local RSA check
+GOOGLE_JWKS = jwt.PyJWKClient("https://www.googleapis.com/oauth2/v3/certs", cache_keys=True, lifespan=3600)
+
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# Short-lived cache of user rows keyed by lowercased email, to collapse bursts of identical lookups.
+# Only existing users are cached and password_hash is never stored, since evictions are per
+# process. Handlers run in the threadpool, so access goes through a lock.
+_USER_CACHE = TTLCache(maxsize=10_000, ttl=float(os.getenv("USER_CACHE_TTL", "5")))
+_USER_CACHE_LOCK = threading.Lock()
+
+# OTP rate limiting per (client IP, email). RATE_LIMIT_STORAGE_URI must point at Redis when running
+# several uvicorn workers; the in-memory default is per process and would multiply the limit.
+# The guard only sees WEB_CONCURRENCY: a worker count passed as `uvicorn --workers N` is not visible
+# to the app, so set the worker count through the env var.
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+if RATE_LIMIT_STORAGE_URI.startswith("memory://") and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    raise RuntimeError("RATE_LIMIT_STORAGE_URI must use shared storage (e.g. redis://) when WEB_CONCURRENCY > 1")
+_RATE_LIMITER = strategies.MovingWindowRateLimiter(storage.storage_from_string(RATE_LIMIT_STORAGE_URI))
+OTP_RATE_LIMIT = parse(os.getenv("OTP_RATE_LIMIT", "5/minute"))
+
+# Shared HTTP client so OAuth token exchanges reuse warm TLS connections
+HTTP = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=10.0,
+)
+
+
+@router.on_event("shutdown")
+async def _close_http_client():
+    await HTTP.aclose()
+
 # ---- Models ----
 
 class SignupRequest(BaseModel):
@@ -66,13 +126,24 @@ class TokenResponse(BaseModel):
 class TokenLoginRequest(BaseModel):
     token: str
 
+_GOOGLE_START = OAuthStartResponse(authorization_url=GOOGLE_AUTH_URL)
+_FACEBOOK_START = OAuthStartResponse(authorization_url=FACEBOOK_AUTH_URL)
+
 # ---- Helpers ----
 
 def _hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return PH.hash(password)
 
 def _verify_password(password: str, hashed: str) -> bool:
-    return pwd_context.verify(password, hashed)
+    if not hashed.startswith("$argon2"):
+        return pwd_context.verify(password, hashed)
+    try:
+        return PH.verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def _password_needs_rehash(hashed: str) -> bool:
+    return not hashed.startswith("$argon2") or PH.check_needs_rehash(hashed)
 
 def _create_token(payload: Dict[str, Any]) -> str:
     to_encode = payload.copy()
@@ -84,84 +155,129 @@ def _decode_token(token: str) -> Dict[str, Any]:
     return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
 
 
-def _get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, email, password_hash, display_name, provider, provider_id FROM users WHERE email = %s",
-        (email,),
+def _verify_google_id_token(id_token: str, client_id: str) -> Dict[str, Any]:
+    # May fetch Google's JWKS on a cache miss, so call it from the threadpool
+    signing_key = GOOGLE_JWKS.get_signing_key_from_jwt(id_token)
+    return jwt.decode(
+        id_token,
+        signing_key.key,
+        algorithms=["RS256"],
+        audience=client_id,
+        issuer=("accounts.google.com", "https://accounts.google.com"),
     )
-    row = cursor.fetchone()
+
+
+def _get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+    key = email.lower()
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(key)
+    if cached is not None:
+        return cached
+    with db_cursor() as cursor:
+        cursor.execute(
+            "SELECT id, email, display_name, provider, provider_id FROM users WHERE email = %s",
+            (email,),
+        )
+        row = cursor.fetchone()
     if not row:
         return None
-    return {
+    user = {
         "id": row[0],
         "email": row[1],
-        "password_hash": row[2],
-        "display_name": row[3],
-        "provider": row[4],
-        "provider_id": row[5],
+        "display_name": row[2],
+        "provider": row[3],
+        "provider_id": row[4],
     }
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[key] = user
+    return user
+
+
+def _get_credentials(email: str) -> Optional[Dict[str, Any]]:
+    # Always read fresh: a password change must take effect in every worker immediately
+    with db_cursor() as cursor:
+        cursor.execute(
+            "SELECT id, email, password_hash FROM users WHERE email = %s",
+            (email,),
+        )
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return {"id": row[0], "email": row[1], "password_hash": row[2]}
+
+
+def _forget_user(email: str):
+    with _USER_CACHE_LOCK:
+        _USER_CACHE.pop(email.lower(), None)
 
 
 def _insert_user(email: str, password_hash: Optional[str], display_name: Optional[str], provider: str, provider_id: Optional[str]) -> int:
-    conn = get_conn()
-    cursor = conn.cursor()
-    # Return new primary key to use as token subject
-    cursor.execute(
-        """
-        INSERT INTO users (email, password_hash, display_name, provider, provider_id)
-        VALUES (%s, %s, %s, %s, %s)
-        """,
-        (email, password_hash, display_name, provider, provider_id),
-    )
-    new_id = cursor.lastrowid
-    conn.commit()
+    # Raises IntegrityError (ER_DUP_ENTRY) if the email is already registered (unique index on users.email)
+    with db_cursor() as cursor:
+        # Return new primary key to use as token subject
+        cursor.execute(
+            """
+            INSERT INTO users (email, password_hash, display_name, provider, provider_id)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (email, password_hash, display_name, provider, provider_id),
+        )
+        new_id = cursor.lastrowid
+    _forget_user(email)
     return int(new_id)
 
 
+def _upsert_user(email: str, display_name: Optional[str], provider: str, provider_id: Optional[str]) -> int:
+    # Insert an OAuth user or return the existing id in a single round trip.
+    # LAST_INSERT_ID(id) makes lastrowid the existing primary key on duplicate email.
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO users (email, password_hash, display_name, provider, provider_id)
+            VALUES (%s, NULL, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), display_name = COALESCE(display_name, VALUES(display_name))
+            """,
+            (email, display_name, provider, provider_id),
+        )
+        user_id = cursor.lastrowid
+    _forget_user(email)
+    return int(user_id)
+
+
 def _set_otp(email: str, otp: str, expires_at: datetime):
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET otp_code = %s, otp_expires_at = %s WHERE email = %s",
-        (otp, expires_at, email),
-    )
-    conn.commit()
+    with db_cursor() as cursor:
+        cursor.execute(
+            "UPDATE users SET otp_code = %s, otp_expires_at = %s WHERE email = %s",
+            (otp, expires_at, email),
+        )
 
 
 def _consume_otp(email: str, otp: str) -> bool:
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT otp_code, otp_expires_at FROM users WHERE email = %s",
-        (email,),
-    )
-    row = cursor.fetchone()
-    if not row:
-        return False
-    code, expires_at = row
-    if not code or code != otp:
-        return False
-    if expires_at and datetime.utcnow() > expires_at:
-        return False
-    # clear otp
-    cursor.execute(
-        "UPDATE users SET otp_code = NULL, otp_expires_at = NULL WHERE email = %s",
-        (email,),
-    )
-    conn.commit()
-    return True
+    with db_cursor() as cursor:
+        # Match and clear in one statement so an OTP can only be consumed once
+        cursor.execute(
+            """
+            UPDATE users SET otp_code = NULL, otp_expires_at = NULL
+            WHERE email = %s AND otp_code = %s AND (otp_expires_at IS NULL OR otp_expires_at > %s)
+            """,
+            (email, otp, datetime.utcnow()),
+        )
+        return cursor.rowcount == 1
 
 
 def _update_password(email: str, password_hash: str):
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET password_hash = %s WHERE email = %s",
-        (password_hash, email),
-    )
-    conn.commit()
+    with db_cursor() as cursor:
+        cursor.execute(
+            "UPDATE users SET password_hash = %s WHERE email = %s",
+            (password_hash, email),
+        )
+    _forget_user(email)
+
+
+def _check_rate_limit(scope: str, request: Request, email: str):
+    client_ip = request.client.host if request.client else "unknown"
+    if not _RATE_LIMITER.hit(OTP_RATE_LIMIT, scope, client_ip, email.lower()):
+        raise HTTPException(status_code=429, detail="Too many requests, try again later")
 
 
 def _send_email_stub(email: str, subject: str, body: str):
@@ -171,32 +287,36 @@ def _send_email_stub(email: str, subject: str, body: str):
 # ---- Routes ----
 
 @router.post("/signup", response_model=TokenResponse)
-async def signup(payload: SignupRequest):
-    existing = _get_user_by_email(payload.email)
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
+def signup(payload: SignupRequest):
     password_hash = _hash_password(payload.password)
-    user_id = _insert_user(payload.email, password_hash, payload.display_name, provider="local", provider_id=None)
+    try:
+        user_id = _insert_user(payload.email, password_hash, payload.display_name, provider="local", provider_id=None)
+    except IntegrityError as e:
+        if e.errno != errorcode.ER_DUP_ENTRY:
+            raise
+        raise HTTPException(status_code=400, detail="Email already registered")
     token = _create_token({"sub": str(user_id), "email": payload.email})
     return TokenResponse(access_token=token)
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(payload: LoginRequest):
-    user = _get_user_by_email(payload.email)
+def login(payload: LoginRequest):
+    user = _get_credentials(payload.email)
     if not user or not user.get("password_hash"):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not _verify_password(payload.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if _password_needs_rehash(user["password_hash"]):
+        _update_password(user["email"], _hash_password(payload.password))
     token = _create_token({"sub": str(user["id"]), "email": user["email"]})
     return TokenResponse(access_token=token)
 
 
 @router.post("/login/token", response_model=TokenResponse)
-async def login_with_token(payload: TokenLoginRequest = Body(...)):
+def login_with_token(payload: TokenLoginRequest = Body(...)):
     try:
         claims = _decode_token(payload.token)
-    except JWTError:
+    except PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     user_id = claims.get("sub")
@@ -216,63 +336,48 @@ async def login_with_token(payload: TokenLoginRequest = Body(...)):
 # OAuth start endpoints (return the URL the client should open). Real implementation requires client IDs/secrets and redirect URIs.
 @router.get("/oauth/google/start", response_model=OAuthStartResponse)
 async def google_start():
-    client_id = os.getenv("OAUTH_GOOGLE_CLIENT_ID", "")
-    redirect_uri = os.getenv("OAUTH_GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/oauth/google/callback")
-    scope = "openid email profile"
-    auth_url = (
-        "https://accounts.google.com/o/oauth2/v2/auth"
-        f"?client_id={client_id}&redirect_uri={redirect_uri}&response_type=code&scope={scope}&access_type=offline"
-    )
-    return OAuthStartResponse(authorization_url=auth_url)
+    return _GOOGLE_START
 
 
 @router.post("/oauth/google/callback", response_model=TokenResponse)
 async def google_callback(payload: OAuthCallbackRequest):
-    client_id = os.getenv("OAUTH_GOOGLE_CLIENT_ID")
-    client_secret = os.getenv("OAUTH_GOOGLE_CLIENT_SECRET")
-    redirect_uri = os.getenv("OAUTH_GOOGLE_REDIRECT_URI", "http://localhost:8001/auth/oauth/google/callback")
-    
-    if not client_id or not client_secret:
+    if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
     
     # Exchange code for tokens
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "code": payload.code,
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "redirect_uri": redirect_uri,
-                "grant_type": "authorization_code",
-            }
-        )
-        
-        if token_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to exchange code for token")
-        
-        tokens = token_response.json()
-        id_token = tokens.get("id_token")
-        
-        # Decode ID token (Google tokens are JWTs, but for simplicity we trust them here)
-        # In production, verify signature using Google's public keys
-        try:
-            claims = jwt.decode(id_token, options={"verify_signature": False})
-            email = claims.get("email")
-            google_id = claims.get("sub")
-            display_name = claims.get("name")
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid ID token")
+    token_response = await HTTP.post(
+        "https://oauth2.googleapis.com/token",
+        data={
+            "code": payload.code,
+            "client_id": GOOGLE_CLIENT_ID,
+            "client_secret": GOOGLE_CLIENT_SECRET,
+            "redirect_uri": GOOGLE_REDIRECT_URI,
+            "grant_type": "authorization_code",
+        }
+    )
+    
+    if token_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to exchange code for token")
+    
+    tokens = token_response.json()
+    id_token = tokens.get("id_token")
+    
+    # Verify the ID token signature, audience and issuer against Google's public keys
+    try:
+        claims = await run_in_threadpool(_verify_google_id_token, id_token, GOOGLE_CLIENT_ID)
+        email = claims.get("email")
+        google_id = claims.get("sub")
+        display_name = claims.get("name")
+    except PyJWKClientConnectionError:
+        raise HTTPException(status_code=502, detail="Could not fetch Google signing keys")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid ID token")
     
     if not email:
         raise HTTPException(status_code=400, detail="Email not provided by Google")
     
-    user = _get_user_by_email(email)
-    user_id: int
-    if not user:
-        user_id = _insert_user(email, None, display_name, provider="google", provider_id=google_id)
-    else:
-        user_id = int(user["id"])
+    # Blocking DB helper runs in the threadpool to keep the event loop free
+    user_id = await run_in_threadpool(_upsert_user, email, display_name, provider="google", provider_id=google_id)
 
     token = _create_token({"sub": str(user_id), "email": email})
     return TokenResponse(access_token=token)
@@ -280,32 +385,21 @@ async def google_callback(payload: OAuthCallbackRequest):
 
 @router.get("/oauth/facebook/start", response_model=OAuthStartResponse)
 async def facebook_start():
-    client_id = os.getenv("OAUTH_FACEBOOK_CLIENT_ID", "")
-    redirect_uri = os.getenv("OAUTH_FACEBOOK_REDIRECT_URI", "http://localhost:8000/auth/oauth/facebook/callback")
-    scope = "email,public_profile"
-    auth_url = (
-        "https://www.facebook.com/v11.0/dialog/oauth"
-        f"?client_id={client_id}&redirect_uri={redirect_uri}&response_type=code&scope={scope}"
-    )
-    return OAuthStartResponse(authorization_url=auth_url)
+    return _FACEBOOK_START
 
 
 @router.post("/oauth/facebook/callback", response_model=TokenResponse)
-async def facebook_callback(payload: OAuthCallbackRequest):
+def facebook_callback(payload: OAuthCallbackRequest):
     # TODO: exchange code for tokens using Facebook token endpoint, get user info (id,email)
     email = f"facebook_user_{payload.code}@example.com"
-    user = _get_user_by_email(email)
-    user_id: int
-    if not user:
-        user_id = _insert_user(email, None, None, provider="facebook", provider_id=email)
-    else:
-        user_id = int(user["id"])
+    user_id = _upsert_user(email, None, provider="facebook", provider_id=email)
     token = _create_token({"sub": str(user_id), "email": email})
     return TokenResponse(access_token=token)
 
 
 @router.post("/password/otp/request")
-async def request_otp(payload: OTPRequest):
+def request_otp(payload: OTPRequest, request: Request):
+    _check_rate_limit("otp_request", request, payload.email)
     user = _get_user_by_email(payload.email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -317,7 +411,8 @@ async def request_otp(payload: OTPRequest):
 
 
 @router.post("/password/otp/verify", response_model=TokenResponse)
-async def verify_otp(payload: OTPVerifyRequest):
+def verify_otp(payload: OTPVerifyRequest, request: Request):
+    _check_rate_limit("otp_verify", request, payload.email)
     user = _get_user_by_email(payload.email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1,24 +1,34 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-from datetime import date
-import mysql.connector
-from openai import OpenAI
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from anyio import to_thread
+from starlette.background import BackgroundTask
+from openai import AsyncOpenAI
 from starlette.middleware.wsgi import WSGIMiddleware
 from app.auth_service import router as auth_router
+from app.transactions import router as transactions_router
 from dotenv import load_dotenv
+import logging
 import os
+import orjson
 
 # Load environment variables from secrets.env
 load_dotenv('.env')
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Mount auth router
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Mount auth and transaction routers
 app.include_router(auth_router)
+app.include_router(transactions_router)
+
+# Sync (DB-bound) handlers run in anyio's threadpool; raise its default limit of 40
+@app.on_event("startup")
+async def _configure_threadpool():
+    to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREADPOOL_SIZE", "100"))
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url="https://router.huggingface.co/v1",
     api_key=os.getenv('AI_APIKEY'),
 )
@@ -33,137 +43,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database connection
-def get_conn():
-    return mysql.connector.connect(
-        host=os.getenv('DB_SERVER'),
-        port=int(os.getenv('DB_PORT', 3306)),
-        database=os.getenv('DB_DATABASE'),
-        user=os.getenv('DB_USERNAME'),
-        password=os.getenv('DB_PASSWORD'),
-    )
-
 
-class Transaction(BaseModel):
-    content: str
-    currency: str
-    amount: float
-    type: str
-    date: Optional[str] = None
-    category: str
-    tags: str
-    notes: Optional[str] = None
-    user_id: int
-
-@app.post("/addTransaction")
-async def add_transaction(transaction: Transaction):
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        # Fill optional fields with defaults if missing
-        tx_date = transaction.date
-        if not tx_date:
-            tx_date = date.today().isoformat()
-        if tx_date == 'null':
-            tx_date = date.today().isoformat()
-        tx_notes = transaction.notes
-        if tx_notes is None:
-            tx_notes = 'None'
-
-        print(transaction)
-        cursor.execute('''
-            INSERT INTO transactions (content, currency, amount, type, date, category, tags, notes, userid)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (transaction.content, transaction.currency, transaction.amount, transaction.type, tx_date, transaction.category, transaction.tags, tx_notes, transaction.user_id))
-        conn.commit()
-        conn.close()
-        return {"message": "Transaction added successfully"}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/transactions")
-async def get_transactions(user_id: int):
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        print(user_id)
-        cursor.execute('SELECT * FROM transactions WHERE userid = %s', (user_id,))
-        rows = cursor.fetchall()
-        transactions = []
-        for row in rows:
-            transactions.append({
-                "id": row[0],
-                "content": row[1],
-                "currency": row[2],
-                "amount": row[3],
-                "type": row[4],
-                "date": row[5],
-                "category": row[6],
-                "tags": row[7],
-                "notes": row[8],
-                "user_id": row[9] if len(row) > 9 else None
-            })
-        conn.close()
-        return transactions
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Delete function to remove selected transaction
-@app.delete("/deleteTransaction/{transaction_id}")
-async def delete_transaction(transaction_id: int):
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM transactions WHERE id = %s', (transaction_id,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Transaction not found")
-        conn.close()
-        return {"message": "Transaction deleted successfully"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Update function to modify existing transaction
-@app.put("/updateTransaction/{transaction_id}")
-async def update_transaction(transaction_id: int, transaction: Transaction):
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        
-        # Check if transaction exists
-        cursor.execute('SELECT id FROM transactions WHERE id = %s', (transaction_id,))
-        if not cursor.fetchone():
-            conn.close()
-            raise HTTPException(status_code=404, detail="Transaction not found")
-        
-        # Optional fields filter
-        tx_date = transaction.date
-        if not tx_date:
-            tx_date = date.today().isoformat()
-        if tx_date == 'null':
-            tx_date = date.today().isoformat()
-        
-        tx_notes = transaction.notes
-        if tx_notes is None:
-            tx_notes = 'None'
-        
-        cursor.execute('''
-            UPDATE transactions
-            SET content = %s, currency = %s, amount = %s, type = %s, date = %s, category = %s, tags = %s, notes = %s
-            WHERE id = %s
-        ''', (transaction.content, transaction.currency, transaction.amount, transaction.type, tx_date, transaction.category, transaction.tags, tx_notes, transaction_id))
-        conn.commit()
-        conn.close()
-        
-        return {"message": "Transaction updated successfully"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+GENERATE_MODEL = "meta-llama/Llama-3.2-3B-Instruct:novita"
+# Built once and sent as an identical prefix on every call, so providers that cache prompt prefixes can reuse it
+SYSTEM_PROMPT = (
+    "You are a parsing assistant that helps to parse scripts into relevant details and respond in JSON format. "
+    "You are not to answer any prompts without the JSON formatting in your responses. "
+    "When a user submit a transaction, your job is to parse them into these categories: content(str), currency(str), amount(int64), type(str, only between income and expense), date(YYYY-MM-DD), category(str), tags(str), notes(str). "
+    "Available categories include (Food & Drinks, Education, Transportation, Health, Entertainment, Utilities, Devices, Others). "
+    "Available tags include (Personal, Family, Work). "
+    "If date or note information is missing, return null for those fields. "
+    "Always return just a string for the values of each keys. "
+    "THE CONTENT FIELD SHOULD NOT CONTAIN ANY OTHER DETAILS (e.g new phone for 500USD is NOT a valid content field, but new phone is). "
+    "USE THE CONTENT'S CONTEXT to fill in the category and tags field (e.g 'breakfast of banh mi' means Food and Drinks category and Personal tag while 'november tuition fees' means Education category and Family tag). "
+    "Always respond in raw JSON format and do not tamper it with Markdown or other formatting methods. "
+    "DO NOT RESPOND LIKE A NORMAL CHAT AI IN ANY CIRCUMSTANCES."
+)
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+# Longer prompts are truncated to bound upstream latency and token cost
+MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "2000"))
 
 
 @app.post("/generate")
@@ -172,28 +70,41 @@ async def generate(request: Request):
     prompt = data.get("prompt", "")
     if not prompt:
         return {"error": "No prompt provided"}
-    response = client.chat.completions.create(
-    model="meta-llama/Llama-3.2-3B-Instruct:novita",
-    messages=[
-        {
-            "role": "system", 
-            "content": "You are a parsing assistant that helps to parse scripts into relevant details and respond in JSON format. You are not to answer any prompts without the JSON formatting in your responses. When a user submit a transaction, your job is to parse them into these categories: content(str), currency(str), amount(int64), type(str, only between income and expense), date(YYYY-MM-DD), category(str), tags(str), notes(str). Available categories include (Food & Drinks, Education, Transportation, Health, Entertainment, Utilities, Devices, Others). Available tags include (Personal, Family, Work). If date or note information is missing, return null for those fields. Always return just a string for the values of each keys. THE CONTENT FIELD SHOULD NOT CONTAIN ANY OTHER DETAILS (e.g new phone for 500USD is NOT a valid content field, but new phone is). USE THE CONTENT'S CONTEXT to fill in the category and tags field (e.g 'breakfast of banh mi' means Food and Drinks category and Personal tag while 'november tuition fees' means Education category and Family tag). Always respond in raw JSON format and do not tamper it with Markdown or other formatting methods. DO NOT RESPOND LIKE A NORMAL CHAT AI IN ANY CIRCUMSTANCES."
-        },
-        {
-            "role": "user",
-            "content": prompt
-        },    
-    ],
-    )    
-    print(response.choices[0].message.content)
-    return response.choices[0].message.content
+    stream = await client.chat.completions.create(
+        model=GENERATE_MODEL,
+        stream=True,
+        messages=[_SYSTEM_MESSAGE, {"role": "user", "content": prompt[:MAX_PROMPT_CHARS]}],
+    )
+
+    # Relay tokens as they arrive instead of buffering the whole completion
+    async def relay():
+        parts = [] if logger.isEnabledFor(logging.DEBUG) else None
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                text = chunk.choices[0].delta.content
+                if parts is not None:
+                    parts.append(text)
+                yield text
+        if parts is not None:
+            logger.debug("generate response=%s", "".join(parts))
+
+    # The background task also closes the upstream response if the client disconnects
+    # before relay() is ever iterated; closing twice is a no-op.
+    return StreamingResponse(relay(), media_type="text/plain", background=BackgroundTask(stream.close))
+
+# Constant bodies are encoded once; a fresh Response is still built per request because
+# middleware (e.g. CORS) mutates response headers in place.
+_PING_BODY = orjson.dumps({"status": "healthy"})
+_ROOT_BODY = orjson.dumps({"message": "Welcome to the FinA Transactions API"})
 
 # Ping
 @app.get("/ping")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(content=_PING_BODY, media_type="application/json")
 
 @app.get("/")
 async def read_root():
-    return {"message": "Welcome to the FinA Transactions API"}
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
@@ -0,0 +1,76 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+import mysql.connector.pooling
+from mysql.connector.constants import ClientFlag
+from mysql.connector.errors import PoolError
+from dotenv import load_dotenv
+
+# Load environment variables from secrets.env first, then .env
+load_dotenv("secrets.env")
+load_dotenv()
+
+# DB connection pool shared by every router; close() returns a connection to the pool.
+# DB_SERVER/DB_PORT normally point at the ProxySQL sidecar (see docker-compose.yml), which
+# multiplexes every worker onto a few backend sessions, so each worker only keeps a small pool.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# The pool opens all of its connections when it is built, so it is created on first use
+# rather than at import: importing the app must not require a reachable database.
+_POOL: Optional[mysql.connector.pooling.MySQLConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> mysql.connector.pooling.MySQLConnectionPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="fina",
+                    pool_size=DB_POOL_SIZE,
+                    pool_reset_session=False,
+                    autocommit=True,
+                    # rowcount reports matched rows, so an UPDATE that changes nothing still counts as found
+                    client_flags=[ClientFlag.FOUND_ROWS],
+                    # Plain cursors on purpose: mysql.connector's prepared cursors deallocate their statement on
+                    # close(), so a per-request cursor(prepared=True) would add round trips rather than save them.
+                    host=os.getenv('DB_SERVER'),
+                    port=int(os.getenv('DB_PORT', 3306)),
+                    database=os.getenv('DB_DATABASE'),
+                    user=os.getenv('DB_USERNAME'),
+                    password=os.getenv('DB_PASSWORD'),
+                )
+    return _POOL
+
+
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# The threadpool is much larger than the pool, and mysql.connector raises PoolError instead of
+# blocking when it is exhausted, so db_cursor() queues callers on a semaphore sized to the pool.
+_POOL_SLOTS = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+def _get_conn():
+    # Only called from db_cursor() while holding a _POOL_SLOTS permit, which keeps the permits
+    # equal to the free connections in the pool
+    return _get_pool().get_connection()
+
+
+@contextmanager
+def db_cursor():
+    # Always returns the connection to the pool, even when a query raises. The pool already
+    # checks is_connected() (a ping) on checkout, so dead connections are reconnected there.
+    if not _POOL_SLOTS.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolError("Timed out waiting for a pooled connection")
+    try:
+        conn = _get_conn()
+        try:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+    finally:
+        _POOL_SLOTS.release()
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date
+from app.db import db_cursor
+
+router = APIRouter(tags=["transactions"])
+
+
+class Transaction(BaseModel):
+    content: str
+    currency: str
+    amount: float
+    type: str
+    date: Optional[str] = None
+    category: str
+    tags: str
+    notes: Optional[str] = None
+    user_id: int
+
+# Response keys for rows of the transactions table, in column order
+TRANSACTION_FIELDS = ("id", "content", "currency", "amount", "type", "date", "category", "tags", "notes", "user_id")
+
+@router.post("/addTransaction")
+def add_transaction(transaction: Transaction):
+    try:
+        # Fill optional fields with defaults if missing
+        tx_date = transaction.date
+        if not tx_date:
+            tx_date = date.today().isoformat()
+        if tx_date == 'null':
+            tx_date = date.today().isoformat()
+        tx_notes = transaction.notes
+        if tx_notes is None:
+            tx_notes = 'None'
+
+        with db_cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO transactions (content, currency, amount, type, date, category, tags, notes, userid)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (transaction.content, transaction.currency, transaction.amount, transaction.type, tx_date, transaction.category, transaction.tags, tx_notes, transaction.user_id))
+        return {"message": "Transaction added successfully"}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/transactions")
+def get_transactions(user_id: int, limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0)):
+    try:
+        # Only the columns we return, in TRANSACTION_FIELDS order (uses idx_transactions_userid)
+        query = 'SELECT id, content, currency, amount, type, date, category, tags, notes, userid FROM transactions WHERE userid = %s'
+        params = (user_id,)
+        if limit is not None:
+            query += ' ORDER BY id LIMIT %s OFFSET %s'
+            params += (limit, offset)
+        with db_cursor() as cursor:
+            cursor.execute(query, params)
+            transactions = [dict(zip(TRANSACTION_FIELDS, row)) for row in cursor.fetchall()]
+        return transactions
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Delete function to remove selected transaction
+@router.delete("/deleteTransaction/{transaction_id}")
+def delete_transaction(transaction_id: int):
+    try:
+        with db_cursor() as cursor:
+            cursor.execute('DELETE FROM transactions WHERE id = %s', (transaction_id,))
+            deleted = cursor.rowcount
+        if deleted == 0:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        return {"message": "Transaction deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Update function to modify existing transaction
+@router.put("/updateTransaction/{transaction_id}")
+def update_transaction(transaction_id: int, transaction: Transaction):
+    try:
+        # Optional fields filter
+        tx_date = transaction.date
+        if not tx_date:
+            tx_date = date.today().isoformat()
+        if tx_date == 'null':
+            tx_date = date.today().isoformat()
+        
+        tx_notes = transaction.notes
+        if tx_notes is None:
+            tx_notes = 'None'
+        
+        with db_cursor() as cursor:
+            cursor.execute('''
+                UPDATE transactions
+                SET content = %s, currency = %s, amount = %s, type = %s, date = %s, category = %s, tags = %s, notes = %s
+                WHERE id = %s
+            ''', (transaction.content, transaction.currency, transaction.amount, transaction.type, tx_date, transaction.category, transaction.tags, tx_notes, transaction_id))
+            updated = cursor.rowcount
+        if updated == 0:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+
+        return {"message": "Transaction updated successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,3 @@
+-- Signup relies on a duplicate-key error and the OAuth callbacks on
+-- INSERT ... ON DUPLICATE KEY UPDATE, both of which need users.email to be unique.
+ALTER TABLE users ADD UNIQUE INDEX uq_users_email (email);
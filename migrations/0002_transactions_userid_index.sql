@@ -0,0 +1,3 @@
+-- GET /transactions filters on userid; check with
+-- EXPLAIN SELECT id FROM transactions WHERE userid = 1;
+CREATE INDEX idx_transactions_userid ON transactions (userid);